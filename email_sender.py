@@ -10,42 +10,130 @@ import os
 import smtplib
 import re
 import sys
-import getpass
-from email.mime.text import MIMEText
+import functools
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
+from email import encoders
 from datetime import datetime
-import time
+from types import SimpleNamespace
 
-# Try to load .env file if available
-try:
-    from dotenv import load_dotenv
-    load_dotenv()
-    print("✅ Loaded configuration from .env file")
-except ImportError:
-    pass  # Will use environment variables
-except Exception as e:
-    print(f"⚠️ Error loading .env file: {e}")
+# Script name shown in help and hint messages
+_SCRIPT_NAME = os.path.basename(__file__)
+
+# Pattern used for every question / file scan, compiled once
+_AND_RE = re.compile(r',\s*and\b', re.IGNORECASE)
+
+@functools.lru_cache(maxsize=8)
+def _parse_recipients(raw):
+    """Split a comma separated recipient string into a tuple of addresses"""
+    return tuple(filter(None, (email.strip() for email in raw.split(','))))
+
+@functools.lru_cache(maxsize=1)
+def _load_config():
+    """Load the .env file once and snapshot the configuration from the environment"""
+    # Try to load .env file if available
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+        dotenv_status = 'loaded'
+        print("✅ Loaded configuration from .env file")
+    except ImportError:
+        dotenv_status = 'not_installed'  # Will use environment variables
+    except Exception as e:
+        dotenv_status = 'error'
+        print(f"⚠️ Error loading .env file: {e}")
+    
+    env = os.environ
+    
+    # Support multiple recipients - comma separated
+    # First check for new RECIPIENT_EMAILS, fall back to old RECIPIENT_EMAIL for compatibility
+    recipient_emails = _parse_recipients(env.get('RECIPIENT_EMAILS', env.get('RECIPIENT_EMAIL', '')))
+    
+    # Numeric settings are parsed here once; an invalid one falls back to its own default
+    numeric = {}
+    invalid = []
+    for name, default in (('SMTP_PORT', 587), ('MAX_QUESTIONS_PER_EMAIL', 10)):
+        value = env.get(name, str(default))
+        try:
+            numeric[name] = int(value)
+        except ValueError:
+            numeric[name] = default
+            invalid.append(f"{name}={value!r} (using {default})")
+    if invalid:
+        print(f"⚠️ Invalid numeric setting: {', '.join(invalid)}")
+    smtp_port = numeric['SMTP_PORT']
+    max_questions = numeric['MAX_QUESTIONS_PER_EMAIL']
+    
+    return SimpleNamespace(
+        dotenv_status=dotenv_status,
+        # Email configuration - set these as environment variables for security
+        smtp_server=env.get('SMTP_SERVER', 'smtp.gmail.com'),
+        smtp_port=smtp_port,
+        sender_email=env.get('SENDER_EMAIL', ''),
+        sender_password=env.get('SENDER_PASSWORD', ''),  # Use App Password for Gmail
+        recipient_emails=recipient_emails,
+        max_questions=max_questions,
+        # File paths
+        extemp_file=env.get('EXTEMP_FILE', 'extemp_questions.txt'),
+        sent_log_file=env.get('SENT_LOG_FILE', 'sent_questions_log.txt'),
+    )
+
+@functools.lru_cache(maxsize=4096)
+def _truncate_question(question_text):
+    """
+    Truncate question at ',and' and add '?' if needed
+    Cached at module level so repeated questions are a dict lookup
+    Examples:
+    - "How effective is superchlorination, and what alternatives..." -> "How effective is superchlorination?"
+    - "Why did the market crash, and how will it recover?" -> "Why did the market crash?"
+    - "What is the impact of climate change?" -> "What is the impact of climate change?" (unchanged)
+    """
+    # Look for ",and" (case insensitive) and truncate there
+    parts = _AND_RE.split(question_text, maxsplit=1)
+    if len(parts) > 1:
+        # Truncate at the comma before "and"
+        truncated = parts[0].strip()
+        
+        # Add question mark if it doesn't end with one
+        if not truncated.endswith('?'):
+            truncated += '?'
+            
+        return truncated
+    
+    # No ",and" found, return original question
+    return question_text
+
+@functools.lru_cache(maxsize=64)
+def _category_class(category):
+    """Map a 'Category:' value to its CSS class (domestic/international/mixed)"""
+    # Only a handful of distinct category strings exist, so lowercase each once
+    category = category.lower()
+    is_domestic = 'domestic' in category
+    is_international = 'international' in category
+    if is_domestic and not is_international:
+        return 'domestic'
+    if is_international and not is_domestic:
+        return 'international'
+    return 'mixed'
 
 class ExtempEmailSender:
     def __init__(self):
-        # Email configuration - set these as environment variables for security
-        self.smtp_server = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
-        self.smtp_port = int(os.getenv('SMTP_PORT', '587'))
-        self.sender_email = os.getenv('SENDER_EMAIL', '')
-        self.sender_password = os.getenv('SENDER_PASSWORD', '')  # Use App Password for Gmail
+        config = _load_config()
         
-        # Support multiple recipients - comma separated
-        # First check for new RECIPIENT_EMAILS, fall back to old RECIPIENT_EMAIL for compatibility
-        recipient_emails_str = os.getenv('RECIPIENT_EMAILS', os.getenv('RECIPIENT_EMAIL', ''))
-        if recipient_emails_str:
-            self.recipient_emails = [email.strip() for email in recipient_emails_str.split(',')]
-        else:
-            self.recipient_emails = []
+        self.smtp_server = config.smtp_server
+        self.smtp_port = config.smtp_port
+        self.sender_email = config.sender_email
+        self.sender_password = config.sender_password
+        self.recipient_emails = config.recipient_emails
         
         # File paths
-        self.extemp_file = os.getenv('EXTEMP_FILE', 'extemp_questions.txt')
-        self.sent_log_file = os.getenv('SENT_LOG_FILE', 'sent_questions_log.txt')
+        self.extemp_file = config.extemp_file
+        self.sent_log_file = config.sent_log_file
+        
+        # Append-only descriptor for the sent log, opened on first write
+        self._sent_fd = None
+        # In-memory copy of the sent log, loaded on first read
+        self._sent_links = None
         
     def validate_config(self):
         """Validate email configuration"""
@@ -56,28 +144,8 @@ class ExtempEmailSender:
         return True
 
     def truncate_question_at_and(self, question_text):
-        """
-        Truncate question at ',and' and add '?' if needed
-        Examples:
-        - "How effective is superchlorination, and what alternatives..." -> "How effective is superchlorination?"
-        - "Why did the market crash, and how will it recover?" -> "Why did the market crash?"
-        - "What is the impact of climate change?" -> "What is the impact of climate change?" (unchanged)
-        """
-        # Look for ",and" (case insensitive) and truncate there
-        match = re.search(r',\s*and\b', question_text, re.IGNORECASE)
-        if match:
-            # Truncate at the comma before "and"
-            truncated = question_text[:match.start()].strip()
-            
-            # Add question mark if it doesn't end with one
-            if not truncated.endswith('?'):
-                truncated += '?'
-                
-            print(f"📝 Truncated question at ',and': {len(question_text)} -> {len(truncated)} chars")
-            return truncated
-        
-        # No ",and" found, return original question
-        return question_text
+        """Truncate question at ',and' and add '?' if needed (see _truncate_question)"""
+        return _truncate_question(question_text)
 
     def read_extemp_questions(self):
         """Read and parse extemp questions from the file with improved parsing for your format"""
@@ -98,6 +166,8 @@ class ExtempEmailSender:
         
         # Parse the content into question blocks - updated for your format
         question_blocks = []
+        # Per-block diagnostics are collected and printed once at the end
+        log_lines = []
         
         # Split content by "Link:" to get each article block
         sections = re.split(r'\n(?=Link: )', content.strip())
@@ -133,12 +203,7 @@ class ExtempEmailSender:
                     current_category = line.replace('Category:', '').strip()
                     
                     # Determine category class for styling
-                    if 'domestic' in current_category.lower() and 'international' not in current_category.lower():
-                        category_class = 'domestic'
-                    elif 'international' in current_category.lower() and 'domestic' not in current_category.lower():
-                        category_class = 'international'
-                    else:
-                        category_class = 'mixed'
+                    category_class = _category_class(current_category)
                     
                     # Store category for next question
                     current_block['_next_category'] = current_category
@@ -175,9 +240,12 @@ class ExtempEmailSender:
                 if len(current_block['questions']) > 0 and len(current_block['content']) > 50:
                     question_blocks.append(current_block)
                     truncated_count = sum(1 for q in current_block['questions'] if q['text'] != q['original_text'])
-                    print(f"✅ Valid block: {current_block['link'][:60]}... ({len(current_block['questions'])} questions, {truncated_count} truncated)")
+                    log_lines.append(f"✅ Valid block: {current_block['link'][:60]}... ({len(current_block['questions'])} questions, {truncated_count} truncated)")
                 else:
-                    print(f"⚠️ Skipping incomplete block: {current_block['link'][:60]}...")
+                    log_lines.append(f"⚠️ Skipping incomplete block: {current_block['link'][:60]}...")
+        
+        if log_lines:
+            print('\n'.join(log_lines))
         
         # Summary of truncation
         total_questions = sum(len(block['questions']) for block in question_blocks)
@@ -191,10 +259,14 @@ class ExtempEmailSender:
         return question_blocks
     
     def read_sent_log(self):
-        """Read the log of already sent questions with improved format detection"""
+        """Read the log of already sent questions with improved format detection (cached after first read)"""
+        if self._sent_links is not None:
+            return self._sent_links
+        
         if not os.path.exists(self.sent_log_file):
             print("📋 No sent log found - all questions will be treated as new")
-            return set()
+            self._sent_links = set()
+            return self._sent_links
         
         try:
             with open(self.sent_log_file, 'r', encoding='utf-8') as f:
@@ -202,7 +274,8 @@ class ExtempEmailSender:
             
             if not content:
                 print("📋 Sent log is empty - all questions will be treated as new")
-                return set()
+                self._sent_links = set()
+                return self._sent_links
             
             sent_links = set()
             for line in content.split('\n'):
@@ -216,26 +289,53 @@ class ExtempEmailSender:
                         sent_links.add(f"Link: {line}")
             
             print(f"📋 Found {len(sent_links)} already sent questions in log")
+            self._sent_links = sent_links
             return sent_links
         except Exception as e:
             print(f"⚠️ Error reading sent log: {e}")
-            return set()
+            # Cache the empty result too, so later is_sent() calls don't re-read and re-warn
+            self._sent_links = set()
+            return self._sent_links
+    
+    def is_sent(self, link):
+        """Check whether a link is already in the sent log"""
+        if not link.startswith('Link: '):
+            link = f"Link: {link}"
+        return link in self.read_sent_log()
     
     def write_sent_log(self, link):
         """Add a link to the sent log with proper format"""
+        self.write_sent_log_batch([link])
+    
+    def write_sent_log_batch(self, links):
+        """Add several links to the sent log with a single write/fsync"""
         try:
-            # Ensure the link is in the correct format
-            if not link.startswith('Link: '):
-                link = f"Link: {link}"
-            
-            with open(self.sent_log_file, 'a', encoding='utf-8') as f:
-                f.write(f"{link}\n")
-                f.flush()
-                os.fsync(f.fileno())
-            print(f"📝 Added to sent log: {link[:60]}...")
+            # Ensure every link is in the correct format
+            links = [link if link.startswith('Link: ') else f"Link: {link}" for link in links]
+            
+            # Keep one append-mode descriptor open for the sender's lifetime
+            if self._sent_fd is None:
+                self._sent_fd = os.open(self.sent_log_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            
+            os.write(self._sent_fd, ''.join(f"{link}\n" for link in links).encode('utf-8'))
+            os.fsync(self._sent_fd)
+            
+            # Keep the cached copy in step with the file
+            if self._sent_links is not None:
+                self._sent_links.update(links)
+            print('\n'.join(f"📝 Added to sent log: {link[:60]}..." for link in links))
         except Exception as e:
             print(f"⚠️ Error writing to sent log: {e}")
     
+    def close(self):
+        """Close the sent log descriptor if it was opened"""
+        if getattr(self, '_sent_fd', None) is not None:
+            os.close(self._sent_fd)
+            self._sent_fd = None
+    
+    def __del__(self):
+        self.close()
+    
     def format_email_content(self, question_blocks):
         """Format question blocks into beautiful HTML email content"""
         
@@ -525,12 +625,7 @@ class ExtempEmailSender:
                         questions.append(current_question)
                     category = line.replace('Category:', '').strip()
                     # Determine category class
-                    if 'domestic' in category.lower() and 'international' not in category.lower():
-                        category_class = 'domestic'
-                    elif 'international' in category.lower() and 'domestic' not in category.lower():
-                        category_class = 'international'
-                    else:
-                        category_class = 'mixed'
+                    category_class = _category_class(category)
                     
                     current_question = {
                         'category': category,
@@ -641,6 +736,15 @@ class ExtempEmailSender:
         
         return html_content, text_content
     
+    def _build_text_part(self, body, subtype):
+        """Build a utf-8 text/* MIME part from a body encoded once up front"""
+        # MIMEText re-scans the str body through the charset machinery; setting the
+        # pre-encoded bytes and base64-encoding them directly skips that pass
+        part = MIMEBase('text', subtype, charset='utf-8')
+        part.set_payload(body.encode('utf-8'))
+        encoders.encode_base64(part)
+        return part
+
     def send_email(self, subject, html_body, text_body):
         """Send beautiful HTML email with fallback text version to multiple recipients"""
         try:
@@ -651,8 +755,8 @@ class ExtempEmailSender:
             msg['Subject'] = subject
             
             # Add both HTML and text versions
-            text_part = MIMEText(text_body, 'plain', 'utf-8')
-            html_part = MIMEText(html_body, 'html', 'utf-8')
+            text_part = self._build_text_part(text_body, 'plain')
+            html_part = self._build_text_part(html_body, 'html')
             
             msg.attach(text_part)
             msg.attach(html_part)
@@ -665,8 +769,8 @@ class ExtempEmailSender:
                 # Send to all recipients
                 server.sendmail(self.sender_email, self.recipient_emails, msg.as_string())
             
-            print(f"✅ Beautiful HTML email sent to {len(self.recipient_emails)} recipients!")
-            print(f"📧 Recipients: {', '.join(self.recipient_emails)}")
+            print(f"✅ Beautiful HTML email sent to {len(self.recipient_emails)} recipients!\n"
+                  f"📧 Recipients: {', '.join(self.recipient_emails)}")
             return True
             
         except smtplib.SMTPAuthenticationError:
@@ -689,7 +793,7 @@ class ExtempEmailSender:
             
             # Read questions and sent log
             all_question_blocks = self.read_extemp_questions()
-            sent_links = self.read_sent_log()
+            self.read_sent_log()
             
             if not all_question_blocks:
                 print("❌ No question blocks found to send")
@@ -697,15 +801,19 @@ class ExtempEmailSender:
             
             # Filter out already sent questions with improved matching
             new_question_blocks = []
+            log_lines = []
             for block in all_question_blocks:
                 block_link = block['link']
                 
-                # Check if this exact link is in sent_links
-                if block_link not in sent_links:
+                # Check if this exact link is in the sent log
+                if not self.is_sent(block_link):
                     new_question_blocks.append(block)
-                    print(f"📧 NEW: {block_link[:60]}...")
+                    log_lines.append(f"📧 NEW: {block_link[:60]}...")
                 else:
-                    print(f"✅ SENT: {block_link[:60]}...")
+                    log_lines.append(f"✅ SENT: {block_link[:60]}...")
+            
+            if log_lines:
+                print('\n'.join(log_lines))
             
             if not new_question_blocks:
                 print("📧 No new questions to send - all questions have been sent already")
@@ -719,6 +827,11 @@ class ExtempEmailSender:
             # Send questions in batches
             questions_to_send = new_question_blocks[:max_questions_per_email]
             
+            # Nothing fits in this batch (e.g. MAX_QUESTIONS_PER_EMAIL=0) - skip formatting, sending and logging
+            if not questions_to_send:
+                print("📧 No question blocks selected for this batch - nothing to send")
+                return True
+            
             if len(new_question_blocks) > max_questions_per_email:
                 print(f"📧 Sending first {max_questions_per_email} question blocks in this batch")
                 print(f"📧 Remaining {len(new_question_blocks) - max_questions_per_email} will be sent in next run")
@@ -744,8 +857,14 @@ class ExtempEmailSender:
             if self.send_email(subject, html_body, text_body):
                 # Mark questions as sent
                 print(f"\n✅ Email sent successfully! Marking questions as sent...")
+                # A link can appear in more than one block; log it only once
+                links = []
+                seen = set()
                 for block in questions_to_send:
-                    self.write_sent_log(block['link'])
+                    if block['link'] not in seen:
+                        seen.add(block['link'])
+                        links.append(block['link'])
+                self.write_sent_log_batch(links)
                 
                 print(f"🎉 Successfully sent {len(questions_to_send)} question blocks!")
                 
@@ -763,14 +882,22 @@ class ExtempEmailSender:
             traceback.print_exc()
             return False
 
+def _write_lines(lines):
+    """Write a block of status lines to stdout with a single write"""
+    sys.stdout.write('\n'.join(lines) + '\n')
+
 def create_env_file():
     """Create a .env file with email configuration"""
-    print("📧 Email Configuration Setup")
-    print("=" * 40)
-    print("This will help you set up email sending for your extemp questions.")
-    print("For Gmail, you'll need to use an App Password, not your regular password.")
-    print("Learn how to create Gmail App Password: https://support.google.com/accounts/answer/185833")
-    print()
+    import getpass  # Only needed for interactive setup
+    
+    _write_lines([
+        "📧 Email Configuration Setup",
+        "=" * 40,
+        "This will help you set up email sending for your extemp questions.",
+        "For Gmail, you'll need to use an App Password, not your regular password.",
+        "Learn how to create Gmail App Password: https://support.google.com/accounts/answer/185833",
+        ""
+    ])
     
     # Get email configuration
     sender_email = input("Enter your email address (sender): ").strip()
@@ -778,17 +905,21 @@ def create_env_file():
         print("❌ Email address is required")
         return False
     
-    print(f"\nFor Gmail users: Use an App Password, not your regular password")
-    print(f"App Passwords are more secure and work better with automated scripts")
+    _write_lines([
+        "\nFor Gmail users: Use an App Password, not your regular password",
+        "App Passwords are more secure and work better with automated scripts"
+    ])
     sender_password = getpass.getpass("Enter your email password/app password: ").strip()
     if not sender_password:
         print("❌ Password is required")
         return False
     
     # Support multiple recipients
-    print("\n📧 Recipient Email Addresses")
-    print("You can enter multiple email addresses separated by commas")
-    print("Example: person1@email.com, person2@email.com, person3@email.com")
+    _write_lines([
+        "\n📧 Recipient Email Addresses",
+        "You can enter multiple email addresses separated by commas",
+        "Example: person1@email.com, person2@email.com, person3@email.com"
+    ])
     recipient_emails = input("Enter recipient email address(es): ").strip()
     if not recipient_emails:
         print("❌ At least one recipient email is required")
@@ -799,17 +930,13 @@ def create_env_file():
     smtp_server = input("SMTP Server (default: smtp.gmail.com): ").strip() or "smtp.gmail.com"
     smtp_port = input("SMTP Port (default: 587): ").strip() or "587"
     
-    try:
-        int(smtp_port)
-    except ValueError:
+    if not smtp_port.isdecimal():
         print("❌ Invalid port number, using default 587")
         smtp_port = "587"
     
     max_questions = input("Max questions per email (default: 10): ").strip() or "10"
     
-    try:
-        int(max_questions)
-    except ValueError:
+    if not max_questions.isdecimal():
         print("❌ Invalid number, using default 10")
         max_questions = "10"
     
@@ -832,151 +959,186 @@ MAX_QUESTIONS_PER_EMAIL={max_questions}
 # SENT_LOG_FILE=sent_questions_log.txt
 """
     
-    # Write .env file
+    # Write .env file - via a 0600 temp file renamed into place, so a crash never leaves it half-written
     try:
-        with open('.env', 'w') as f:
-            f.write(env_content)
+        # Start from a fresh file: O_CREAT's mode only applies when the file is created
+        try:
+            os.remove('.env.tmp')
+        except FileNotFoundError:
+            pass
+        fd = os.open('.env.tmp', os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            os.write(fd, env_content.encode('utf-8'))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace('.env.tmp', '.env')
         
         # Count recipients
-        recipient_list = [email.strip() for email in recipient_emails.split(',')]
-        
-        print(f"\n✅ Configuration saved to .env file")
-        print(f"✅ Sender: {sender_email}")
-        print(f"✅ Recipients ({len(recipient_list)}): {', '.join(recipient_list)}")
-        print(f"✅ SMTP: {smtp_server}:{smtp_port}")
-        print(f"✅ Max questions per email: {max_questions}")
+        recipient_list = _parse_recipients(recipient_emails)
         
-        print(f"\n💡 To use this configuration:")
-        print(f"   pip install python-dotenv")
-        print(f"   python {os.path.basename(__file__)}")
-        
-        print(f"\n🔒 Security Note:")
-        print(f"   - The .env file contains your password")
-        print(f"   - Add .env to your .gitignore file")
-        print(f"   - Never commit passwords to version control")
-        
-        print(f"\n✂️ Question Truncation Feature:")
-        print(f"   - Questions containing ',and' will be automatically shortened")
-        print(f"   - Only the first part before ',and' will be kept")
-        print(f"   - A '?' will be added if the truncated question doesn't end with one")
-        print(f"   - Example: 'How effective is this, and what alternatives...' -> 'How effective is this?'")
+        _write_lines([
+            "\n✅ Configuration saved to .env file",
+            f"✅ Sender: {sender_email}",
+            f"✅ Recipients ({len(recipient_list)}): {', '.join(recipient_list)}",
+            f"✅ SMTP: {smtp_server}:{smtp_port}",
+            f"✅ Max questions per email: {max_questions}",
+            
+            "\n💡 To use this configuration:",
+            "   pip install python-dotenv",
+            f"   python {_SCRIPT_NAME}",
+            
+            "\n🔒 Security Note:",
+            "   - The .env file contains your password",
+            "   - Add .env to your .gitignore file",
+            "   - Never commit passwords to version control",
+            
+            "\n✂️ Question Truncation Feature:",
+            "   - Questions containing ',and' will be automatically shortened",
+            "   - Only the first part before ',and' will be kept",
+            "   - A '?' will be added if the truncated question doesn't end with one",
+            "   - Example: 'How effective is this, and what alternatives...' -> 'How effective is this?'"
+        ])
         
         return True
         
     except Exception as e:
         print(f"❌ Error writing .env file: {e}")
+        # Don't leave partial credentials behind
+        try:
+            os.remove('.env.tmp')
+        except OSError:
+            pass
         return False
 
-def test_configuration():
-    """Test the current configuration"""
-    print("\n🧪 Testing Current Configuration")
-    print("=" * 40)
+def test_configuration(deep=False):
+    """Test the current configuration; deep=True also scans the extemp file and sent log"""
+    _write_lines(["\n🧪 Testing Current Configuration", "=" * 40])
     
-    # Try to load from .env file
-    try:
-        from dotenv import load_dotenv
-        load_dotenv()
-        print("✅ Loaded .env file")
-    except ImportError:
-        print("⚠️ python-dotenv not installed, using system environment variables")
-        print("💡 Install with: pip install python-dotenv")
-    except Exception as e:
-        print(f"⚠️ Error loading .env file: {e}")
+    # The .env file is loaded once by _load_config
+    config = _load_config()
+    
+    # Status lines are collected and written in one go
+    lines = []
+    if config.dotenv_status == 'loaded':
+        lines.append("✅ Loaded .env file")
+    elif config.dotenv_status == 'not_installed':
+        lines.append("⚠️ python-dotenv not installed, using system environment variables")
+        lines.append("💡 Install with: pip install python-dotenv")
     
     # Check required variables - updated for new RECIPIENT_EMAILS format
-    required_vars = ['SENDER_EMAIL', 'SENDER_PASSWORD']
+    required_vars = {
+        'SENDER_EMAIL': config.sender_email,
+        'SENDER_PASSWORD': config.sender_password
+    }
     missing_vars = []
     
-    for var in required_vars:
-        value = os.getenv(var)
+    for var, value in required_vars.items():
         if value:
             if var == 'SENDER_PASSWORD':
-                print(f"✅ {var}: {'*' * min(len(value), 20)}")  # Hide password
+                lines.append(f"✅ {var}: {'*' * min(len(value), 20)}")  # Hide password
             else:
-                print(f"✅ {var}: {value}")
+                lines.append(f"✅ {var}: {value}")
         else:
-            print(f"❌ {var}: Not set")
+            lines.append(f"❌ {var}: Not set")
             missing_vars.append(var)
     
     # Check recipient emails (both new and old format)
-    recipient_emails = os.getenv('RECIPIENT_EMAILS', os.getenv('RECIPIENT_EMAIL', ''))
-    if recipient_emails:
-        recipient_list = [email.strip() for email in recipient_emails.split(',')]
-        print(f"✅ RECIPIENT_EMAILS ({len(recipient_list)}): {', '.join(recipient_list)}")
+    recipient_list = config.recipient_emails
+    if recipient_list:
+        lines.append(f"✅ RECIPIENT_EMAILS ({len(recipient_list)}): {', '.join(recipient_list)}")
     else:
-        print(f"❌ RECIPIENT_EMAILS: Not set")
+        lines.append(f"❌ RECIPIENT_EMAILS: Not set")
         missing_vars.append('RECIPIENT_EMAILS')
     
     # Check optional variables
     optional_vars = {
-        'SMTP_SERVER': 'smtp.gmail.com',
-        'SMTP_PORT': '587',
-        'MAX_QUESTIONS_PER_EMAIL': '10',
-        'EXTEMP_FILE': 'extemp_questions.txt',
-        'SENT_LOG_FILE': 'sent_questions_log.txt'
+        'SMTP_SERVER': config.smtp_server,
+        'SMTP_PORT': config.smtp_port,
+        'MAX_QUESTIONS_PER_EMAIL': config.max_questions,
+        'EXTEMP_FILE': config.extemp_file,
+        'SENT_LOG_FILE': config.sent_log_file
     }
     
-    print(f"\nOptional settings:")
-    for var, default in optional_vars.items():
-        value = os.getenv(var, default)
-        print(f"📝 {var}: {value}")
+    lines.append(f"\nOptional settings:")
+    for var, value in optional_vars.items():
+        lines.append(f"📝 {var}: {value}")
     
     # Check if files exist
-    print(f"\nFile checks:")
-    extemp_file = os.getenv('EXTEMP_FILE', 'extemp_questions.txt')
-    sent_log_file = os.getenv('SENT_LOG_FILE', 'sent_questions_log.txt')
+    lines.append(f"\nFile checks:")
+    extemp_file = config.extemp_file
+    sent_log_file = config.sent_log_file
+    
+    # One stat() call answers both "does it exist" and "how big is it"
+    try:
+        file_size = os.stat(extemp_file).st_size
+    except FileNotFoundError:
+        file_size = None
     
-    if os.path.exists(extemp_file):
-        file_size = os.path.getsize(extemp_file)
-        print(f"✅ Extemp file exists: {extemp_file} ({file_size} bytes)")
+    if file_size is not None:
+        lines.append(f"✅ Extemp file exists: {extemp_file} ({file_size} bytes)")
         
-        # Quick check of file content and truncation potential
-        try:
-            with open(extemp_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-                link_count = len(re.findall(r'^Link: ', content, re.MULTILINE))
-                and_count = len(re.findall(r',\s*and\b', content, re.IGNORECASE))
-                print(f"📊 Found {link_count} articles in extemp file")
-                print(f"✂️ Found {and_count} questions that will be truncated at ',and'")
-        except Exception as e:
-            print(f"⚠️ Could not read extemp file: {e}")
+        # Quick check of file content and truncation potential - one streaming pass
+        if deep:
+            try:
+                link_count = and_count = 0
+                with open(extemp_file, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if line.startswith('Link: '):
+                            link_count += 1
+                        if _AND_RE.search(line):
+                            and_count += 1
+                    lines.append(f"📊 Found {link_count} articles in extemp file")
+                    lines.append(f"✂️ Found {and_count} questions that will be truncated at ',and'")
+            except Exception as e:
+                lines.append(f"⚠️ Could not read extemp file: {e}")
     else:
-        print(f"❌ Extemp file missing: {extemp_file}")
+        lines.append(f"❌ Extemp file missing: {extemp_file}")
     
-    if os.path.exists(sent_log_file):
+    if deep:
+        # Opening the sent log doubles as the existence check
         try:
             with open(sent_log_file, 'r', encoding='utf-8') as f:
-                sent_count = len([line for line in f if line.strip()])
-                print(f"✅ Sent log exists: {sent_log_file} ({sent_count} entries)")
+                sent_count = sum(1 for line in f if line.strip())
+                lines.append(f"✅ Sent log exists: {sent_log_file} ({sent_count} entries)")
+        except FileNotFoundError:
+            lines.append(f"📋 Sent log missing: {sent_log_file} (will be created on first send)")
         except Exception as e:
-            print(f"⚠️ Could not read sent log: {e}")
+            lines.append(f"⚠️ Could not read sent log: {e}")
+    elif os.path.exists(sent_log_file):
+        lines.append(f"✅ Sent log exists: {sent_log_file}")
     else:
-        print(f"📋 Sent log missing: {sent_log_file} (will be created on first send)")
+        lines.append(f"📋 Sent log missing: {sent_log_file} (will be created on first send)")
     
-    # Test truncation function
-    print(f"\n✂️ Testing question truncation feature:")
-    test_sender = ExtempEmailSender()
-    test_questions = [
-        "How effective is superchlorination as a solution to the turbidity issue in Asheville's water supply, and what alternative methods could be explored?",
-        "What are the implications of the trade war, and how will it affect consumers?",
-        "Why did the stock market crash yesterday?",
-        "How has climate change affected agriculture, and what can farmers do to adapt?"
-    ]
+    # Test truncation function (only with --deep)
+    if deep:
+        lines.append(f"\n✂️ Testing question truncation feature:")
+        test_sender = ExtempEmailSender()
+        test_questions = [
+            "How effective is superchlorination as a solution to the turbidity issue in Asheville's water supply, and what alternative methods could be explored?",
+            "What are the implications of the trade war, and how will it affect consumers?",
+            "Why did the stock market crash yesterday?",
+            "How has climate change affected agriculture, and what can farmers do to adapt?"
+        ]
     
-    for original in test_questions:
-        truncated = test_sender.truncate_question_at_and(original)
-        if original != truncated:
-            print(f"  ✂️ Original: {original}")
-            print(f"  ✅ Truncated: {truncated}")
-        else:
-            print(f"  ➡️ No change: {original}")
+        for original in test_questions:
+            truncated = test_sender.truncate_question_at_and(original)
+            if original != truncated:
+                lines.append(f"  ✂️ Original: {original}")
+                lines.append(f"  ✅ Truncated: {truncated}")
+            else:
+                lines.append(f"  ➡️ No change: {original}")
+    else:
+        lines.append(f"\n💡 Run with --test --deep to scan the extemp file and sent log")
     
     if missing_vars:
-        print(f"\n❌ Missing required variables: {', '.join(missing_vars)}")
-        print(f"Please run: python {os.path.basename(__file__)} --setup")
+        lines.append(f"\n❌ Missing required variables: {', '.join(missing_vars)}")
+        lines.append(f"Please run: python {_SCRIPT_NAME} --setup")
+        _write_lines(lines)
         return False
     else:
-        print(f"\n✅ Configuration looks good!")
+        lines.append(f"\n✅ Configuration looks good!")
+        _write_lines(lines)
         
         # Test email sender creation
         try:
@@ -993,15 +1155,15 @@ def test_configuration():
 
 def show_help():
     """Show help information"""
-    script_name = os.path.basename(__file__)
     print(f"""
 📧 NSDA Extemp Questions Email Sender
 
 USAGE:
-    python {script_name}                 # Send emails with current config
-    python {script_name} --setup         # Configure email settings
-    python {script_name} --test          # Test current configuration
-    python {script_name} --help          # Show this help
+    python {_SCRIPT_NAME}                 # Send emails with current config
+    python {_SCRIPT_NAME} --setup         # Configure email settings
+    python {_SCRIPT_NAME} --test          # Test current configuration
+    python {_SCRIPT_NAME} --test --deep   # Also scan the questions file and sent log
+    python {_SCRIPT_NAME} --help          # Show this help
 
 DESCRIPTION:
     Reads extemp questions from extemp_questions.txt and sends them via email.
@@ -1036,50 +1198,61 @@ GMAIL SETUP:
 
 EXAMPLES:
     # First time setup
-    python {script_name} --setup
+    python {_SCRIPT_NAME} --setup
     
     # Send emails
-    python {script_name}
+    python {_SCRIPT_NAME}
     
     # With environment variables
-    SENDER_EMAIL=me@gmail.com RECIPIENT_EMAILS=friend@email.com python {script_name}
+    SENDER_EMAIL=me@gmail.com RECIPIENT_EMAILS=friend@email.com python {_SCRIPT_NAME}
     
     # Multiple recipients
-    RECIPIENT_EMAILS="person1@email.com, person2@email.com" python {script_name}
+    RECIPIENT_EMAILS="person1@email.com, person2@email.com" python {_SCRIPT_NAME}
 
 TRACKING:
-    The script automatically tracks which questions have been sent in {os.getenv('SENT_LOG_FILE', 'sent_questions_log.txt')}.
+    The script automatically tracks which questions have been sent in {_load_config().sent_log_file}.
     Only new questions will be sent in each run.
     Delete the log file to resend all questions.
 """)
 
+def _do_setup():
+    """Handle --setup: interactive configuration"""
+    print("🔧 Extemp Questions Email Sender - Configuration")
+    print("=" * 50)
+    if create_env_file():
+        print(f"\n🎉 Setup complete! Now run: python {_SCRIPT_NAME}")
+
+def _do_test():
+    """Handle --test [--deep]: check the current configuration"""
+    deep = '--deep' in (arg.lower() for arg in sys.argv[2:])
+    if test_configuration(deep=deep):
+        print("\n🎉 Ready to send emails!")
+    else:
+        print(f"\n❌ Please run: python {_SCRIPT_NAME} --setup")
+
+# Command line argument -> handler
+_DISPATCH = {
+    arg: handler
+    for args, handler in [
+        (('--help', '-h', 'help'), show_help),
+        (('--setup', 'setup', 'config', 'configure'), _do_setup),
+        (('--test', 'test'), _do_test),
+    ]
+    for arg in args
+}
+
 def main():
     """Main function with command line interface"""
     if len(sys.argv) > 1:
         arg = sys.argv[1].lower()
+        handler = _DISPATCH.get(arg)
         
-        if arg in ['--help', '-h', 'help']:
-            show_help()
-            return
-            
-        elif arg in ['--setup', 'setup', 'config', 'configure']:
-            print("🔧 Extemp Questions Email Sender - Configuration")
-            print("=" * 50)
-            if create_env_file():
-                print(f"\n🎉 Setup complete! Now run: python {os.path.basename(__file__)}")
-            return
-            
-        elif arg in ['--test', 'test']:
-            if test_configuration():
-                print("\n🎉 Ready to send emails!")
-            else:
-                print(f"\n❌ Please run: python {os.path.basename(__file__)} --setup")
-            return
-            
+        if handler:
+            handler()
         else:
             print(f"❌ Unknown argument: {arg}")
-            print(f"Run: python {os.path.basename(__file__)} --help")
-            return
+            print(f"Run: python {_SCRIPT_NAME} --help")
+        return
     
     # Main email sending functionality
     print("📧 NSDA Extemp Questions Email Sender")
@@ -1087,13 +1260,13 @@ def main():
     
     sender = ExtempEmailSender()
     
-    # Get max questions per email from environment
-    max_questions = int(os.getenv('MAX_QUESTIONS_PER_EMAIL', '10'))
+    # Get max questions per email from the cached configuration
+    max_questions = _load_config().max_questions
     
     success = sender.process_and_send(max_questions_per_email=max_questions)
     
     if not success:
-        print(f"\n💡 Need help? Run: python {os.path.basename(__file__)} --help")
+        print(f"\n💡 Need help? Run: python {_SCRIPT_NAME} --help")
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -1,23 +1,221 @@
 import os
 import re
+import mmap
 from llama_cpp import Llama
 from urllib.parse import urlparse
 import time
 import shutil
+import zlib
+import hashlib
+import shelve
+import json
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 
 # Initialize your LLaMA model with optimized settings
-MODEL_PATH = os.getenv('MODEL_PATH', '/Users/tanishchauhan/Desktop/CEUIL_AI copy/mistral-7b-instruct-v0.1.Q4_K_M.gguf')
-
-llm = Llama(
-    model_path=MODEL_PATH,
-    n_ctx=2048,
-    n_gpu_layers=-1,
-    n_threads=8,
-    n_batch=512,
-    use_mlock=True,
-    use_mmap=True,
-    verbose=False
-)
+# QUANT picks the GGUF quantization (Q3_K_M, Q4_K_M, Q5_K_M); token generation is memory-bound,
+# so a smaller quant streams fewer weight bytes per token. On ARM (Apple Silicon, Graviton) use Q4_0:
+# recent llama.cpp builds repack it for the i8mm/KleidiAI kernels, which roughly doubles prefill speed.
+# MODEL_PATH still overrides the file outright.
+QUANT = os.getenv('QUANT', 'Q4_K_M')
+MODEL_DIR = os.getenv('MODEL_DIR', '/Users/tanishchauhan/Desktop/CEUIL_AI copy')
+MODEL_PATH = os.getenv('MODEL_PATH', os.path.join(MODEL_DIR, f'mistral-7b-instruct-v0.1.{QUANT}.gguf'))
+
+# GPU placement, mirroring llama-bench's -ngl/-mg/-ts so offload can be swept per machine
+N_GPU_LAYERS = int(os.getenv('N_GPU_LAYERS', '-1'))
+MAIN_GPU = int(os.getenv('MAIN_GPU', '0'))
+# Comma-separated share of the model per GPU, e.g. "0.6,0.4"
+TENSOR_SPLIT = [float(share) for share in os.getenv('TENSOR_SPLIT', '').split(',') if share.strip()] or None
+
+# Context window for one prompt plus its answer (~600 header + up to ~1400 article + 400 generated tokens,
+# with headroom for token-dense articles)
+N_CTX = int(os.getenv('N_CTX', '4096'))
+
+# Flash attention fuses the attention kernels, cutting memory reads during prefill; set FLASH_ATTN=0 to disable
+FLASH_ATTN = os.getenv('FLASH_ATTN', '1') != '0'
+
+# Element type of the KV cache; q8_0 halves its memory traffic at negligible quality cost.
+# A quantized value cache needs flash attention, so without it only the keys are quantized.
+GGML_TYPES = {'f16': 1, 'q4_0': 2, 'q8_0': 8}
+KV_CACHE_TYPE = os.getenv('KV_CACHE_TYPE', 'q8_0').lower()
+if KV_CACHE_TYPE not in GGML_TYPES:
+    print(f"⚠️ Invalid KV_CACHE_TYPE {KV_CACHE_TYPE!r} (allowed: {', '.join(GGML_TYPES)}), using f16")
+    KV_CACHE_TYPE = 'f16'
+
+# Prompt tokens submitted per llama.cpp batch, and evaluated per kernel launch (n_ubatch);
+# larger batches speed up prefill of ~1400-token prompts
+N_BATCH = int(os.getenv('N_BATCH', '1024'))
+N_UBATCH = int(os.getenv('N_UBATCH', '512'))
+
+# A running llama-server (e.g. "llama-server -m model.gguf -c 16384 -np 4 --port 8080") to send prompts to
+# instead of loading the model in this process; its prompt cache keeps the shared header evaluated
+LLAMA_SERVER_URL = os.getenv('LLAMA_SERVER_URL')
+# Articles in flight at once; match the server's -np slot count so it decodes them together
+SERVER_SLOTS = int(os.getenv('SERVER_SLOTS', '4'))
+
+# Questions already generated for an article, keyed by a hash of its text, so repeated articles
+# skip the model; set EXTEMP_CACHE to an empty string to disable
+EXTEMP_CACHE = os.getenv('EXTEMP_CACHE', 'extemp_cache')
+
+# Speculative decoding: draft this many tokens per step by prompt lookup (0 disables it).
+# Needs llama-cpp-python 0.2.54 or later; older builds ignore it.
+DRAFT_TOKENS = int(os.getenv('DRAFT_TOKENS', '0'))
+
+def _physical_core_cpus():
+    """CPU ids covering each physical core once (Linux sysfs topology), or None if unknown"""
+    try:
+        allowed = os.sched_getaffinity(0)
+    except AttributeError:
+        return None
+    core_cpus = set()
+    seen_cores = set()
+    for cpu in sorted(allowed):
+        try:
+            with open(f'/sys/devices/system/cpu/cpu{cpu}/topology/thread_siblings_list') as f:
+                siblings = f.read().strip()
+        except OSError:
+            return None
+        if siblings not in seen_cores:
+            seen_cores.add(siblings)
+            core_cpus.add(cpu)
+    return core_cpus or None
+
+def detect_threads():
+    """Thread count for llama.cpp: N_THREADS if set, otherwise one per physical core
+
+    llama.cpp's kernels are memory-bandwidth-bound, so SMT siblings only add contention.
+    On Linux the process is pinned to one logical CPU per core; on multi-socket machines
+    also run under `numactl --cpunodebind=0 --membind=0`.
+    """
+    if os.getenv('N_THREADS'):
+        return int(os.getenv('N_THREADS'))
+    
+    core_cpus = _physical_core_cpus()
+    if core_cpus:
+        if len(core_cpus) < len(os.sched_getaffinity(0)):
+            os.sched_setaffinity(0, core_cpus)
+            print(f"📌 Pinned to {len(core_cpus)} physical cores")
+        return len(core_cpus)
+    
+    try:
+        import psutil
+        physical_cores = psutil.cpu_count(logical=False)
+    except ImportError:
+        physical_cores = None
+    return physical_cores or os.cpu_count() or 8
+
+_LLM = None
+_PREFIX_TOKENS = None
+
+def _get_llm():
+    """Load the model on first use so callers that only parse articles don't pay for it"""
+    global _LLM, _PREFIX_TOKENS
+    if _LLM is None:
+        n_threads = detect_threads()
+        print(f"🧵 Using {n_threads} threads")
+        draft_model = None
+        if DRAFT_TOKENS > 0:
+            try:
+                from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+                draft_model = LlamaPromptLookupDecoding(num_pred_tokens=DRAFT_TOKENS)
+                print(f"🔮 Speculative decoding: drafting {DRAFT_TOKENS} tokens per step")
+            except ImportError:
+                print("⚠️ This llama-cpp-python has no speculative decoding, DRAFT_TOKENS ignored")
+        _LLM = Llama(
+            model_path=MODEL_PATH,
+            n_ctx=N_CTX,
+            type_k=GGML_TYPES[KV_CACHE_TYPE],
+            type_v=GGML_TYPES[KV_CACHE_TYPE if FLASH_ATTN else 'f16'],
+            flash_attn=FLASH_ATTN,
+            offload_kqv=True,  # Keep the KV cache and attention on the GPU with the offloaded layers
+            n_gpu_layers=N_GPU_LAYERS,
+            main_gpu=MAIN_GPU,
+            tensor_split=TENSOR_SPLIT,
+            n_threads=n_threads,
+            n_threads_batch=n_threads,
+            n_batch=N_BATCH,
+            n_ubatch=N_UBATCH,  # Physical micro-batch on builds that split it from n_batch
+            use_mlock=True,
+            use_mmap=True,
+            draft_model=draft_model,
+            verbose=False
+        )
+        log_model_footprint(_LLM)
+        log_gpu_offload(_LLM)
+        # Drop the trailing space: the tokenizer's leading-space handling puts it on the article's first token
+        _PREFIX_TOKENS = _LLM.tokenize(_PROMPT_PREFIX.rstrip(' ').encode('utf-8'))
+        prefill_prefix(_LLM, _PREFIX_TOKENS)
+    return _LLM
+
+# INT4 AWQ build of the same model, used through vLLM when a CUDA GPU is available
+VLLM_MODEL = os.getenv('VLLM_MODEL', 'TheBloke/Mistral-7B-Instruct-v0.1-AWQ')
+_VLLM = None
+
+def _get_vllm():
+    """Load a vLLM engine on first use if vllm is installed and a CUDA GPU is available, else return None"""
+    global _VLLM
+    if _VLLM is None:
+        _VLLM = False
+        try:
+            import torch
+            from vllm import LLM
+        except ImportError:
+            return None
+        if not torch.cuda.is_available():
+            return None
+        print(f"🚀 CUDA GPU found, generating with vLLM ({VLLM_MODEL})")
+        try:
+            _VLLM = LLM(
+                model=VLLM_MODEL,
+                quantization="awq",
+                dtype="float16",
+                gpu_memory_utilization=0.9,
+                max_num_seqs=32
+            )
+        except Exception as e:
+            # e.g. the model can't be downloaded or doesn't fit; llama.cpp can still run on this machine
+            print(f"⚠️ Could not start vLLM, falling back to llama.cpp: {e}")
+            _VLLM = False
+            return None
+    return _VLLM or None
+
+def log_model_footprint(llm):
+    """Print the loaded model's size and parameter count so quantizations can be compared"""
+    model_name = os.path.basename(MODEL_PATH)
+    try:
+        import llama_cpp
+        model_size = llama_cpp.llama_model_size(llm.model)
+        n_params = llama_cpp.llama_model_n_params(llm.model)
+        print(f"🧠 Model {model_name}: {model_size / 1e9:.2f} GB, {n_params / 1e9:.2f}B parameters")
+    except Exception:
+        try:
+            print(f"🧠 Model {model_name}: {os.path.getsize(MODEL_PATH) / 1e9:.2f} GB on disk")
+        except OSError:
+            print(f"🧠 Model {model_name}: size unavailable")
+
+# GPU backends named in llama.cpp's system info, unless reported as disabled ("CUDA = 0")
+_GPU_BACKEND_RE = re.compile(r'\b(?:CUDA|cuBLAS|Metal|ROCm|hipBLAS|HIP|Vulkan)\b(?! = 0)', re.IGNORECASE)
+
+def log_gpu_offload(llm):
+    """Print the device settings and warn when the llama.cpp build cannot offload to a GPU"""
+    try:
+        import llama_cpp
+        system_info = llama_cpp.llama_print_system_info().decode('utf-8', 'ignore').strip()
+        if hasattr(llama_cpp, 'llama_supports_gpu_offload'):
+            gpu_build = bool(llama_cpp.llama_supports_gpu_offload())
+        else:
+            # Older builds only report the backend through the system info string. Only GPU backends
+            # count: "BLAS = 1" is also set by CPU-only OpenBLAS builds
+            gpu_build = bool(_GPU_BACKEND_RE.search(system_info))
+        model_params = getattr(llm, 'model_params', None)
+        n_gpu_layers = getattr(model_params, 'n_gpu_layers', N_GPU_LAYERS)
+        print(f"🖥️ n_gpu_layers={n_gpu_layers}, main_gpu={MAIN_GPU}, tensor_split={TENSOR_SPLIT}, n_ctx={llm.n_ctx()}")
+        print(f"🖥️ llama.cpp system info: {system_info}")
+        if n_gpu_layers != 0 and not gpu_build:
+            print("⚠️ This llama.cpp build has no GPU backend - n_gpu_layers is ignored and inference runs on CPU")
+    except Exception as e:
+        print(f"⚠️ Could not verify GPU offload: {e}")
 
 # NSDA Extemp prompt template focusing on analysis and argumentation
 PROMPT_TEMPLATE = """Create exactly 3 NSDA Extemporaneous Speaking questions from this news article.
@@ -57,119 +255,242 @@ Article: {article}
 Generate exactly 3 analytical extemp questions now:
 """
 
+# Fixed text around the article, split once so prompts are built by concatenation
+_PROMPT_PREFIX, _PROMPT_SUFFIX = PROMPT_TEMPLATE.split('{article}')
+
+def prefill_prefix(llm, prefix_tokens):
+    """Prefill the static prompt header into the KV cache
+
+    Every prompt starts with these tokens, and generate() keeps the longest matching prefix of what is
+    already evaluated, so the header is reused by every article without snapshotting the state.
+    """
+    try:
+        llm.reset()
+        llm.eval(prefix_tokens)
+    except Exception as e:
+        print(f"⚠️ Could not prefill prompt header, it will be evaluated with the first article: {e}")
+        llm.reset()
+
+# ASCII characters str.strip() treats as whitespace
+_ASCII_WHITESPACE = b' \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f'
+
+def _strip_line(line):
+    """Strip a UTF-8 encoded line exactly like str.strip() would, without decoding it in the common case"""
+    line = line.strip(_ASCII_WHITESPACE)
+    if line and (line[0] >= 0x80 or line[-1] >= 0x80):
+        # Non-ASCII edge; it may be Unicode whitespace
+        line = line.decode('utf-8').strip().encode('utf-8')
+    return line
+
+def _iter_article_blocks(mm):
+    """Yield (start_offset, lines) for each blank-line separated block of the mapped file
+
+    lines are the block's stripped, non-empty byte lines; start_offset is where its first line begins.
+    """
+    block = []
+    block_start = 0
+    line_start = mm.tell()
+    for raw_line in iter(mm.readline, b''):
+        # Handle \r\n and bare \r line endings inline instead of normalizing the whole file
+        if raw_line.endswith(b'\n'):
+            raw_line = raw_line[:-1]
+        if raw_line.endswith(b'\r'):
+            raw_line = raw_line[:-1]
+        for line in raw_line.split(b'\r'):
+            stripped = _strip_line(line)
+            if stripped:
+                if not block:
+                    block_start = line_start
+                block.append(stripped)
+            elif block:
+                yield block_start, block
+                block = []
+            line_start += len(line) + 1
+        line_start = mm.tell()
+    if block:
+        yield block_start, block
+
+_LINK_PREFIX = b"Link: "
+_ARTICLE_PREFIX = b"Article: "
+_ARTICLE_PREFIX_LEN = len(_ARTICLE_PREFIX)
+
+def _parse_article_block(lines):
+    """Return the (link, article) pair in a block of byte lines, or None if it holds no substantial article"""
+    current_link = None
+    article_buf = bytearray()
+    in_article = False
+    
+    for line in lines:
+        if line.startswith(_LINK_PREFIX):
+            current_link = line
+            in_article = False
+            article_buf = bytearray()
+        elif line.startswith(_ARTICLE_PREFIX):
+            # Start collecting article text, including any content on the same line.
+            # The line's end is already stripped, so only leading whitespace can remain.
+            rest = line[_ARTICLE_PREFIX_LEN:]
+            if rest and (rest[0] >= 0x80 or rest[0] in _ASCII_WHITESPACE):
+                rest = _strip_line(rest)
+            article_buf = bytearray(rest)
+            in_article = True
+        elif in_article and current_link:
+            # Continue collecting article text, space-separated in one growing buffer
+            if article_buf:
+                article_buf.append(0x20)
+            article_buf += line
+    
+    # Decode the article once it is complete
+    if current_link and article_buf:
+        current_article = article_buf.decode('utf-8')
+        if len(current_article) > 50:  # Only add substantial articles
+            return current_link.decode('utf-8'), current_article
+    return None
+
 def read_articles(filename):
     """Read articles from file and return list of (link, article) tuples with improved parsing"""
     if not os.path.exists(filename):
         print(f"Input file {filename} does not exist!")
         return []
-        
+    
+    articles = []
+    found_content = False
     try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            content = f.read()
+        if os.path.getsize(filename) > 0:
+            # Map the file and stream it block by block rather than copying it into one string
+            with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                for _, lines in _iter_article_blocks(mm):
+                    found_content = True
+                    parsed = _parse_article_block(lines)
+                    if parsed:
+                        articles.append(parsed)
+                        print(f"✓ Parsed article: {parsed[0][:60]}...")
     except Exception as e:
         print(f"Error reading file {filename}: {e}")
         return []
 
-    if not content.strip():
+    if not found_content:
         print(f"Input file {filename} is empty!")
         return []
-
-    articles = []
-    # Normalize line endings first
-    content = content.replace('\r\n', '\n').replace('\r', '\n')
-    
-    # Split by double newline, but be more flexible
-    article_blocks = re.split(r'\n\s*\n+', content.strip())
-    
-    for block in article_blocks:
-        block = block.strip()
-        if not block:
-            continue
-            
-        lines = [line.strip() for line in block.split('\n') if line.strip()]
-        
-        current_link = None
-        article_lines = []
-        in_article = False
-        
-        for line in lines:
-            if line.startswith("Link: "):
-                current_link = line
-                in_article = False
-                article_lines = []
-            elif line.startswith("Article: "):
-                # Start collecting article text
-                article_content = line[len("Article: "):].strip()
-                if article_content:  # If there's content on the same line
-                    article_lines = [article_content]
-                else:
-                    article_lines = []
-                in_article = True
-            elif in_article and current_link:
-                # Continue collecting article text
-                article_lines.append(line)
-        
-        # Join all article lines and add to articles list
-        if current_link and article_lines:
-            current_article = ' '.join(article_lines).strip()
-            if current_article and len(current_article) > 50:  # Only add substantial articles
-                articles.append((current_link, current_article))
-                print(f"✓ Parsed article: {current_link[:60]}...")
     
     print(f"Successfully parsed {len(articles)} articles from {filename}")
     return articles
 
-def filter_articles_by_length(articles, min_words=30):
-    """Filter out articles shorter than min_words and return filtered list with stats"""
-    filtered_articles = []
-    removed_count = 0
-    
-    for link, article in articles:
-        word_count = len(article.split())
-        if word_count >= min_words:
-            filtered_articles.append((link, article))
-        else:
-            removed_count += 1
-            print(f"🗑️ Removing short article ({word_count} words): {link[:60]}...")
-    
-    return filtered_articles, removed_count
+def iter_articles(filename):
+    """Lazily yield (link, article, end_offset) for each article in the file
 
-def write_articles_to_file(filename, articles):
-    """Write articles to file with proper formatting"""
+    end_offset is the byte offset where the next block starts (or the file size), so everything
+    before it can be dropped from the file once the article has been processed.
+    """
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            pending = None
+            for block_start, lines in _iter_article_blocks(mm):
+                if pending:
+                    yield pending + (block_start,)
+                    pending = None
+                pending = _parse_article_block(lines)
+            if pending:
+                yield pending + (len(mm),)
+
+def _count_link_lines(buf, start=0, end=None):
+    """Count lines starting with "Link: " in buf[start:end], where start is at the start of a line"""
+    end = len(buf) if end is None else end
+    count = int(buf[start:start + 6] == b'Link: ')
+    pos = buf.find(b'\nLink: ', start, end)
+    while pos != -1:
+        count += 1
+        pos = buf.find(b'\nLink: ', pos + 1, end)
+    return count
+
+def count_articles(filename, end=None):
+    """Count the articles in the file (or its first end bytes) the way the workflow does, by "Link: " lines"""
     try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            if articles:
-                for i, (link, article) in enumerate(articles):
-                    f.write(f"{link}\n")
-                    f.write(f"Article: {article}\n")
-                    if i < len(articles) - 1:  # Add separator between articles
-                        f.write("\n")
-            # Force write to disk
-            f.flush()
-            os.fsync(f.fileno())
-        return True
+        with open(filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return 0
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return _count_link_lines(mm, 0, end)
+    except OSError as e:
+        print(f"Error reading file {filename}: {e}")
+        return 0
+
+def trim_articles_file(filename, cut):
+    """Drop the first cut bytes of the file, copying the rest over byte for byte without parsing it
+
+    The copy is written to a temp file, size-checked and then swapped in with os.replace, so on
+    failure the original file is untouched. Returns (articles_removed, crc32 of the bytes written),
+    or None on failure.
+    """
+    tmp_filename = filename + '.tmp'
+    try:
+        with open(filename, 'rb') as src, open(tmp_filename, 'wb') as dst:
+            size = os.fstat(src.fileno()).st_size
+            expected_size = size - cut
+            removed = 0
+            crc = 0
+            if size > 0:
+                with mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    removed = _count_link_lines(mm, 0, cut)
+                    # Write the tail straight from the mapping instead of copying it into a bytes object first
+                    with memoryview(mm) as view, view[cut:] as data:
+                        crc = zlib.crc32(data)
+                        dst.write(data)
+            dst.flush()
+            os.fsync(dst.fileno())
+            if dst.tell() != expected_size:
+                raise IOError(f"wrote {dst.tell()} bytes, expected {expected_size}")
+        os.replace(tmp_filename, filename)
+        return removed, crc
     except Exception as e:
         print(f"Error writing to file {filename}: {e}")
-        return False
+        try:
+            os.remove(tmp_filename)
+        except OSError:
+            pass
+        return None
+
+def file_crc32(filename):
+    """CRC32 of a file's contents, to check it still holds what was last written"""
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return zlib.crc32(mm)
 
 def create_backup(filename):
-    """Create backup of the input file"""
+    """Create backup of the input file and count its articles
+
+    Returns (backup_filename, article_count); backup_filename is None if no backup was made.
+    """
+    if not os.path.exists(filename):
+        return None, 0
     try:
         backup_filename = filename + '.backup'
-        if os.path.exists(filename):
+        if os.path.exists(backup_filename):
+            os.remove(backup_filename)
+        # Updates swap in a new file with os.replace, so a hardlink keeps the original inode
+        # without copying a byte; copy when the link isn't possible (e.g. another filesystem)
+        try:
+            os.link(filename, backup_filename)
+        except OSError:
             shutil.copy2(filename, backup_filename)
-            print(f"✓ Created backup: {backup_filename}")
-            return backup_filename
-        return None
+        print(f"✓ Created backup: {backup_filename}")
     except Exception as e:
         print(f"Error creating backup: {e}")
-        return None
+        backup_filename = None
+    return backup_filename, count_articles(filename)
 
 def restore_from_backup(filename, backup_filename):
     """Restore from backup file"""
     try:
         if backup_filename and os.path.exists(backup_filename):
-            shutil.copy2(backup_filename, filename)
+            os.replace(backup_filename, filename)
             print(f"✅ Restored from backup: {backup_filename}")
             return True
         return False
@@ -177,15 +498,46 @@ def restore_from_backup(filename, backup_filename):
         print(f"Error restoring from backup: {e}")
         return False
 
+# Key analytical words that mark a question as extemp-worthy
+ANALYTICAL_INDICATORS = (
+    'should', 'how', 'what are the implications', 'to what extent',
+    'why', 'what factors', 'how effective', 'what impact',
+    'how will', 'what role', 'analyze', 'evaluate', 'compare'
+)
+
+# Whole words only, so "showcase" doesn't count as "how"; longest first so "how effective" wins over "how"
+_ANALYTICAL_RE = re.compile(
+    r'\b(?:' + '|'.join(re.escape(w) for w in sorted(ANALYTICAL_INDICATORS, key=len, reverse=True)) + r')\b',
+    re.IGNORECASE
+)
+
+# Indicators contained in each match ("how effective" also counts as "how")
+_INDICATOR_PARTS = {
+    w: frozenset(o for o in ANALYTICAL_INDICATORS if re.search(r'\b' + re.escape(o) + r'\b', w))
+    for w in ANALYTICAL_INDICATORS
+}
+
+# Any whitespace other than single spaces between words
+_IRREGULAR_SPACE_RE = re.compile(r'[^\S ]|  |^ | $')
+
+def count_words(text):
+    """Same as len(text.split()), but counts spaces without building the word list when words are single-spaced"""
+    if text and not _IRREGULAR_SPACE_RE.search(text):
+        return text.count(' ') + 1
+    return len(text.split())
+
+# Sentence boundary used by chunk_text
+_SENT_RE = re.compile(r'(?<=[.!?])\s+')
+
 def chunk_text(text, max_words=800):
     """Chunk text by words, ensuring we don't split sentences - larger chunks for extemp context"""
-    sentences = re.split(r'(?<=[.!?])\s+', text)
+    sentences = _SENT_RE.split(text)
     chunks = []
     current_chunk = []
     current_word_count = 0
 
     for sentence in sentences:
-        sentence_words = len(sentence.split())
+        sentence_words = sentence.count(' ') + 1
         
         # If adding this sentence would exceed limit, start new chunk
         if current_word_count + sentence_words > max_words and current_chunk:
@@ -202,94 +554,376 @@ def chunk_text(text, max_words=800):
     
     return chunks
 
+def first_chunk(text, max_words=800):
+    """Return chunk_text(text, max_words)[0], scanning sentences only until the first chunk is full"""
+    current_chunk = []
+    current_word_count = 0
+    start = 0
+    
+    for match in _SENT_RE.finditer(text):
+        sentence = text[start:match.start()]
+        sentence_words = sentence.count(' ') + 1
+        if current_word_count + sentence_words > max_words and current_chunk:
+            return ' '.join(current_chunk)
+        current_chunk.append(sentence)
+        current_word_count += sentence_words
+        start = match.end()
+    
+    # The text after the last sentence break
+    sentence = text[start:]
+    if current_word_count + sentence.count(' ') + 1 > max_words and current_chunk:
+        return ' '.join(current_chunk)
+    current_chunk.append(sentence)
+    return ' '.join(current_chunk)
+
 def extract_headline_from_url(url):
     """Extract a readable headline from the URL"""
-    try:
-        # Try to get headline from URL structure
-        if '/articles/' in url:
-            # BBC style URLs
-            article_id = url.split('/articles/')[-1].split('?')[0]
-            return f"BBC News Article ({article_id})"
-        elif '/news/' in url:
-            # Other news URLs
-            parts = url.split('/')
-            if len(parts) > 4:
-                return f"News Article: {parts[-1].replace('-', ' ').replace('.html', '').title()}"
-    except:
-        pass
+    # Try to get headline from URL structure; the link is only parsed for the domain fallback
+    if '/articles/' in url:
+        # BBC style URLs
+        article_id = url.rpartition('/articles/')[2].partition('?')[0]
+        return f"BBC News Article ({article_id})"
+    elif '/news/' in url and url.count('/') >= 4:
+        # Other news URLs
+        slug = url.rpartition('/')[2]
+        return f"News Article: {slug.replace('-', ' ').replace('.html', '').title()}"
     
     # Fallback to domain name
     try:
-        domain = urlparse(url).netloc
-        return f"News Article from {domain}"
-    except:
+        return f"News Article from {urlparse(url).netloc}"
+    except ValueError:
         return "News Article"
 
-def generate_extemp_questions(article_text):
-    """Generate NSDA Extemp questions from article text"""
+# Text that ends a completion when the model starts drifting past the questions; a Q4 means Q3 is done
+_STOP_STRINGS = ("Article:", "\n\nHere", "Instructions:", "Note:", "\nQ4.", "\n\nQ4")
+
+# Decoding settings shared by every backend. Greedy: the fixed Q1/Q2/Q3 format gains little from
+# sampling, and argmax skips the sampler chain
+MAX_NEW_TOKENS = 400  # Slightly more tokens for analytical questions
+TEMPERATURE = 0.0
+TOP_K = 1
+TOP_P = 1.0
+REPEAT_PENALTY = 1.1
+
+def select_extemp_chunk(article_text, word_count=None):
+    """Pick the part of an article to send to the model
+
+    Returns (chunk, chunk_words); chunk is None when it is too short for extemp questions.
+    """
     # Use larger chunks for extemp since questions need more context
-    word_count = len(article_text.split())
+    if word_count is None:
+        word_count = count_words(article_text)
     
     if word_count > 1000:
-        # Use larger chunks for better context
-        chunks = chunk_text(article_text, max_words=1000)
-        chunk = chunks[0]  # Use first chunk
+        # Use larger chunks for better context; only the first chunk is used, so stop splitting there
+        chunk = first_chunk(article_text, max_words=1000)
+        chunk_words = count_words(chunk)
     else:
         chunk = article_text
+        chunk_words = word_count
     
-    print(f"Processing chunk ({len(chunk.split())} words)...")
+    if chunk_words < 150:  # Extemp needs more context than MCQ
+        return None, chunk_words
+    return chunk, chunk_words
+
+def prepare_extemp_prompt(article_text, word_count=None):
+    """Pick the part of an article to send to the model and tokenize its prompt
+
+    Returns (prompt_tokens, chunk_words); prompt_tokens is None when the chunk is too short for extemp questions.
+    """
+    chunk, chunk_words = select_extemp_chunk(article_text, word_count)
+    if chunk is None:
+        return None, chunk_words
+    
+    # Only the article and closing instruction need tokenizing; the header's tokens are cached
+    llm = _get_llm()
+    article_tokens = llm.tokenize((chunk + _PROMPT_SUFFIX).encode('utf-8'), add_bos=False)
+    return _PREFIX_TOKENS + article_tokens, chunk_words
+
+def generate_extemp_questions(article_text, word_count=None, prepared=None):
+    """Generate NSDA Extemp questions from article text (word_count saves re-splitting it)"""
+    prompt_tokens, chunk_words = prepared or prepare_extemp_prompt(article_text, word_count)
+    
+    print(f"Processing chunk ({chunk_words} words)...")
     
-    if len(chunk.split()) < 150:  # Extemp needs more context than MCQ
+    if prompt_tokens is None:
         print("Chunk too short for quality extemp questions, skipping...")
         return ""
     
-    prompt = PROMPT_TEMPLATE.format(article=chunk)
-    
+    llm = _get_llm()
     try:
         start_time = time.time()
         
-        response = llm(
-            prompt,
-            max_tokens=400,  # Slightly more tokens for analytical questions
-            temperature=0.2,  # Slightly higher for more creative question formation
-            top_p=0.9,
-            stop=["Article:", "\n\nHere", "Instructions:", "Note:"],
-            echo=False
+        # The header from the previous prompt is still in the KV cache; generate() reuses the matching
+        # token prefix and only evaluates the rest
+        n_ctx = llm.n_ctx()
+        if len(prompt_tokens) >= n_ctx:
+            raise ValueError(f"Prompt of {len(prompt_tokens)} tokens does not fit the {n_ctx}-token context")
+        max_tokens = min(MAX_NEW_TOKENS, n_ctx - len(prompt_tokens))
+        eos_token = llm.token_eos()
+        
+        # Sample token by token so generation can stop as soon as the outcome is known
+        tokens = llm.generate(
+            prompt_tokens,
+            top_k=TOP_K,
+            top_p=TOP_P,
+            temp=TEMPERATURE,
+            repeat_penalty=REPEAT_PENALTY
         )
+        output_bytes = bytearray()
+        text = ''
+        for n_tokens, token in enumerate(tokens, 1):
+            if token == eos_token:
+                break
+            piece = llm.detokenize([token])
+            output_bytes += piece
+            text = output_bytes.decode('utf-8', errors='ignore')
+            stop_at = min((text.find(stop) for stop in _STOP_STRINGS if stop in text), default=-1)
+            if stop_at >= 0:
+                text = text[:stop_at]
+                break
+            # Q3 is a complete question - nothing useful comes after it
+            if (b'?' in piece or b'"' in piece) and 'Q3.' in text and text.rstrip().endswith(('?', '?"')):
+                break
+            # Still no Q1 this far in, the output is off-format
+            if n_tokens == 200 and 'Q1.' not in text:
+                break
+            if n_tokens >= max_tokens:
+                break
+        tokens.close()
         
         generation_time = time.time() - start_time
         print(f"Generated in {generation_time:.1f}s")
+    except Exception as e:
+        print(f"Error generating extemp questions: {e}")
+        # Drop any half-evaluated state and prefill the header again; the loaded model is reused for the next article
+        prefill_prefix(llm, _PREFIX_TOKENS)
+        return ""
+    
+    return validate_extemp_questions(text.strip())
+
+def validate_extemp_questions(output):
+    """Return the model output if it holds 3 analytical extemp questions, otherwise an empty string"""
+    # Validate extemp questions - check for analytical nature
+    if 'Q1.' in output and 'Q2.' in output and 'Q3.' in output:
+        # Check if questions are analytical (contain key analytical words), scanning the output once
+        # and stopping as soon as enough distinct indicators have turned up
+        found_indicators = set()
+        for match in _ANALYTICAL_RE.finditer(output):
+            # IGNORECASE also matches Unicode case-fold variants (e.g. "ſhould") that lower() leaves as they are
+            found_indicators |= _INDICATOR_PARTS.get(match.group().lower(), frozenset())
+            if len(found_indicators) >= 2:
+                break
+        analytical_count = len(found_indicators)
         
-        output = response['choices'][0]['text'].strip()
-        
-        # Validate extemp questions - check for analytical nature
-        if 'Q1.' in output and 'Q2.' in output and 'Q3.' in output:
-            # Check if questions are analytical (contain key analytical words)
-            analytical_indicators = [
-                'should', 'how', 'what are the implications', 'to what extent', 
-                'why', 'what factors', 'how effective', 'what impact', 
-                'how will', 'what role', 'analyze', 'evaluate', 'compare'
-            ]
-            
-            output_lower = output.lower()
-            analytical_count = sum(1 for indicator in analytical_indicators if indicator in output_lower)
-            
-            if analytical_count >= 2:  # At least 2 questions should be analytical
-                return output
-            else:
-                print("Generated questions not sufficiently analytical for extemp")
-                return ""
+        if analytical_count >= 2:  # At least 2 questions should be analytical
+            return output
         else:
-            print("Generated output missing required questions")
+            print("Generated questions not sufficiently analytical for extemp")
             return ""
-            
-    except Exception as e:
+    else:
+        print("Generated output missing required questions")
+        return ""
+
+def generate_extemp_questions_vllm(engine, articles):
+    """Generate NSDA Extemp questions for (article_text, word_count) pairs with vLLM, yielding results in input order
+
+    All prompts are submitted in one generate() call so vLLM's continuous batching decodes them together.
+    """
+    from vllm import SamplingParams
+    
+    chunks = [select_extemp_chunk(article_text, word_count) for article_text, word_count in articles]
+    prompts = [_PROMPT_PREFIX + chunk + _PROMPT_SUFFIX for chunk, _ in chunks if chunk is not None]
+    sampling_params = SamplingParams(
+        temperature=TEMPERATURE,
+        top_p=TOP_P,
+        max_tokens=MAX_NEW_TOKENS,
+        stop=list(_STOP_STRINGS)
+    )
+    
+    start_time = time.time()
+    outputs = iter(engine.generate(prompts, sampling_params) if prompts else [])
+    print(f"Generated {len(prompts)} question sets with vLLM in {time.time() - start_time:.1f}s")
+    
+    for chunk, chunk_words in chunks:
+        print(f"Processing chunk ({chunk_words} words)...")
+        if chunk is None:
+            print("Chunk too short for quality extemp questions, skipping...")
+            yield ""
+        else:
+            yield validate_extemp_questions(next(outputs).outputs[0].text.strip())
+
+def request_server_completion(chunk):
+    """POST one article chunk's prompt to the llama-server at LLAMA_SERVER_URL
+
+    Returns (raw response body, seconds taken). Runs on worker threads, so it doesn't print.
+    """
+    payload = {
+        "prompt": _PROMPT_PREFIX + chunk + _PROMPT_SUFFIX,
+        "n_predict": MAX_NEW_TOKENS,
+        "temperature": TEMPERATURE,
+        "top_k": TOP_K,
+        "top_p": TOP_P,
+        "repeat_penalty": REPEAT_PENALTY,
+        "stop": list(_STOP_STRINGS),
+        "cache_prompt": True  # Reuse the server's KV cache for the prompt header shared by every article
+    }
+    start_time = time.time()
+    request = urllib.request.Request(
+        LLAMA_SERVER_URL.rstrip('/') + '/completion',
+        data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'}
+    )
+    with urllib.request.urlopen(request, timeout=600) as response:
+        raw = response.read()
+    return raw, time.time() - start_time
+
+def collect_server_questions(chunk_words, pending):
+    """Wait for one article's llama-server completion and validate it (pending is None for a too-short chunk)"""
+    print(f"Processing chunk ({chunk_words} words)...")
+    
+    if pending is None:
+        print("Chunk too short for quality extemp questions, skipping...")
+        return ""
+    
+    # Connection and HTTP errors (OSError) propagate: with the server failing, no later article can
+    # succeed either, so the caller stops instead of marking the articles processed
+    raw, generation_time = pending.result()
+    try:
+        text = json.loads(raw)['content']
+    except (ValueError, KeyError, TypeError) as e:
         print(f"Error generating extemp questions: {e}")
         return ""
+    
+    print(f"Generated in {generation_time:.1f}s")
+    
+    return validate_extemp_questions(text.strip())
+
+def check_llama_server():
+    """Return True if the llama-server at LLAMA_SERVER_URL is up with its model loaded"""
+    try:
+        # /health answers 503 while the model is still loading, which urlopen raises as HTTPError
+        with urllib.request.urlopen(LLAMA_SERVER_URL.rstrip('/') + '/health', timeout=30) as response:
+            return response.status == 200
+    except OSError as e:
+        print(f"❌ llama-server at {LLAMA_SERVER_URL} is not available: {e}")
+        return False
+
+def generation_fingerprint():
+    """Everything besides the article that decides its questions: backend and model, prompt and decoding settings"""
+    if LLAMA_SERVER_URL:
+        backend = f"llama-server {LLAMA_SERVER_URL}"
+    elif _get_vllm() is not None:
+        backend = f"vllm {VLLM_MODEL}"
+    else:
+        backend = f"llama.cpp {os.path.basename(MODEL_PATH)}"
+    return repr((backend, PROMPT_TEMPLATE, _STOP_STRINGS, MAX_NEW_TOKENS, TEMPERATURE, TOP_K, TOP_P, REPEAT_PENALTY))
+
+def article_cache_key(article_text, fingerprint):
+    """Key for an article in the question cache; a different model, prompt or setting gives a different key"""
+    key = hashlib.blake2b(fingerprint.encode('utf-8'))
+    key.update(b'\0')
+    key.update(article_text.encode('utf-8'))
+    return key.hexdigest()[:24]
+
+def generate_extemp_questions_batch(articles):
+    """Generate NSDA Extemp questions for (article_text, word_count) pairs, yielding results in input order
+
+    Articles whose questions are in the EXTEMP_CACHE shelf are answered from it; the rest go to the model
+    and successful results are stored for next time.
+    """
+    if not EXTEMP_CACHE:
+        yield from _generate_extemp_questions_uncached(articles)
+        return
+    
+    articles = list(articles)
+    fingerprint = generation_fingerprint()
+    keys = [article_cache_key(article_text, fingerprint) for article_text, _ in articles]
+    with shelve.open(EXTEMP_CACHE) as cache:
+        # Decide hits up front so a duplicate within this batch doesn't shift the generated results
+        hits = [key in cache for key in keys]
+        if any(hits):
+            print(f"💾 {sum(hits)} articles already have cached extemp questions")
+        generated = _generate_extemp_questions_uncached(
+            article for article, hit in zip(articles, hits) if not hit
+        )
+        for key, hit in zip(keys, hits):
+            if hit:
+                print("Reusing cached extemp questions")
+                yield cache[key]
+                continue
+            questions = next(generated)
+            if questions:
+                cache[key] = questions
+                # The shelf stays open all run; write each entry through so a killed run keeps it
+                cache.sync()
+            yield questions
+
+def _generate_extemp_questions_uncached(articles):
+    """Generate NSDA Extemp questions for (article_text, word_count) pairs with the model, yielding results in input order
+
+    With LLAMA_SERVER_URL set, up to SERVER_SLOTS articles at a time are sent to that llama-server,
+    which decodes them in parallel slots; with a CUDA GPU and vLLM installed, the articles are
+    batched through vLLM.
+    Otherwise llama-cpp-python's Llama drives a single sequence, so the articles are decoded
+    one after another through the same loaded context. Results are produced lazily, so the
+    caller can write each one out as soon as it is ready. While one article decodes, a
+    helper thread prepares the next article's prompt.
+    """
+    if LLAMA_SERVER_URL:
+        # Keep at most SERVER_SLOTS requests in flight, so stopping early leaves little work behind
+        slots = max(1, SERVER_SLOTS)
+        executor = ThreadPoolExecutor(max_workers=slots)
+        in_flight = deque()
+        try:
+            for article_text, word_count in articles:
+                chunk, chunk_words = select_extemp_chunk(article_text, word_count)
+                pending = executor.submit(request_server_completion, chunk) if chunk is not None else None
+                in_flight.append((chunk_words, pending))
+                if len(in_flight) == slots:
+                    yield collect_server_questions(*in_flight.popleft())
+            while in_flight:
+                yield collect_server_questions(*in_flight.popleft())
+        finally:
+            # Drop queued requests if the caller stops early or a request failed
+            executor.shutdown(cancel_futures=True)
+        return
+    
+    vllm_engine = _get_vllm()
+    if vllm_engine is not None:
+        yield from generate_extemp_questions_vllm(vllm_engine, list(articles))
+        return
+    
+    articles = iter(articles)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        current = next(articles, None)
+        pending = executor.submit(prepare_extemp_prompt, *current) if current else None
+        while current is not None:
+            prepared = pending.result()
+            upcoming = next(articles, None)
+            pending = executor.submit(prepare_extemp_prompt, *upcoming) if upcoming else None
+            yield generate_extemp_questions(*current, prepared=prepared)
+            current = upcoming
+
+def write_extemp_record(out, link, body):
+    """Format one article's extemp record and append it to the output file"""
+    # Extract headline from URL
+    article_info = extract_headline_from_url(link)
+    out.write(
+        f"\n{link}\n"
+        f"Info: {article_info}\n"
+        + "="*80 + "\n"
+        + "NSDA EXTEMPORANEOUS SPEAKING QUESTIONS\n"
+        + "="*80 + "\n"
+        + body
+        + "="*80 + "\n\n"
+    )
 
 def main():
     """Main function to process articles and generate NSDA Extemp questions"""
     input_file = os.getenv('INPUT_FILE', '/Users/tanishchauhan/Desktop/CEUIL_AI/articles/news_articles.txt')
+    # Rescan the input file after each update (slow, for debugging)
+    verify_writes = bool(os.getenv('VERIFY_WRITES'))
     
     print(f"🔍 Reading articles from: {input_file}")
     print(f"📁 Input file exists: {os.path.exists(input_file)}")
@@ -297,52 +931,88 @@ def main():
         print(f"📄 Input file size: {os.path.getsize(input_file)} bytes")
     
     # Create backup before processing
-    backup_filename = create_backup(input_file)
-    
-    # Read all articles at start
-    all_articles = read_articles(input_file)
-    print(f"Found {len(all_articles)} total articles to process")
+    backup_filename, initial_count = create_backup(input_file)
     
-    if not all_articles:
-        print("No articles found in the input file!")
+    if not os.path.exists(input_file):
+        print(f"Input file {input_file} does not exist!")
         return
+    print(f"Found {initial_count} total articles in the input file")
+    
+    # Parse only the articles this run will process; the rest of the file is carried over byte for byte
+    batch_limit = 100  # Process in smaller batches for better reliability
+    min_words = 30
+    print(f"\n🔍 Reading up to {batch_limit} articles, filtering those shorter than {min_words} words...")
+    all_articles = []
+    word_counts = []  # Counted once; the batch and the generator reuse these counts
+    end_offsets = []  # Where each article's block ends in the original file
+    removed_count = 0
+    window_end = 0
+    for link, article, end_offset in iter_articles(input_file):
+        window_end = end_offset
+        word_count = count_words(article)
+        if word_count < min_words:
+            removed_count += 1
+            print(f"🗑️ Removing short article ({word_count} words): {link[:60]}...")
+            continue
+        all_articles.append((link, article))
+        word_counts.append(word_count)
+        end_offsets.append(end_offset)
+        if len(all_articles) == batch_limit:
+            break
+    else:
+        # Reached the end of the file, so anything after the last article goes too
+        window_end = os.path.getsize(input_file)
     
-    # Filter out articles shorter than 30 words BEFORE processing
-    print(f"\n🔍 Filtering articles shorter than 30 words...")
-    filtered_articles, removed_count = filter_articles_by_length(all_articles, min_words=30)
+    # Bytes of the original file already dropped, and the articles they held
+    trimmed = 0
+    removed_total = 0
+    written_crc = None  # CRC32 of the last update, checked once against the file after the batch
+    window_count = count_articles(input_file, window_end)
     
     if removed_count > 0:
-        print(f"\n📝 Updating input file to remove {removed_count} short articles...")
-        if write_articles_to_file(input_file, filtered_articles):
-            print(f"✅ Successfully removed {removed_count} short articles from input file")
-            print(f"📊 Articles remaining for processing: {len(filtered_articles)}")
-        else:
-            print("❌ Failed to update input file")
-            if backup_filename:
-                restore_from_backup(input_file, backup_filename)
-            return
+        print(f"📝 {removed_count} short articles will be removed along with the processed ones")
     else:
         print("✅ No short articles found to remove")
     
-    # Use filtered articles for processing
-    all_articles = filtered_articles
-    
     if not all_articles:
-        print("No articles remaining after filtering!")
+        if window_end > 0 and trim_articles_file(input_file, window_end) is None:
+            print("❌ Failed to update input file")
+            if backup_filename:
+                restore_from_backup(input_file, backup_filename)
+            return
+        print("No articles found to process in the input file!")
         return
     
+    # Load the model before any article is marked processed, so a load failure stops the run cleanly
+    if LLAMA_SERVER_URL:
+        if not check_llama_server():
+            print("❌ Stopping before any article is processed; the input file is unchanged")
+            return
+        print(f"🌐 Generating with llama-server at {LLAMA_SERVER_URL}")
+    elif _get_vllm() is None:
+        _get_llm()
+    
     # Process articles one by one and remove them immediately after processing
-    batch_size = min(100, len(all_articles))  # Process in smaller batches for better reliability
+    batch_size = len(all_articles)
     print(f"📋 Processing {batch_size} articles in this batch...")
     
     successful_count = 0
     processed_articles = []  # Keep track of successfully processed articles
     start_time = time.time()
     
+    # Queue every article long enough for the model up front; results come back in the same order
+    results = generate_extemp_questions_batch(
+        (article, words) for (_, article), words in zip(all_articles, word_counts) if words >= 150
+    )
+    
     # Open extemp questions file in append mode
-    with open('extemp_questions.txt', 'a', encoding='utf-8') as out:
-        for i in range(min(batch_size, len(all_articles))):
+    # A writer thread formats and appends each record while the model decodes the next article;
+    # one worker keeps the records in order
+    with open('extemp_questions.txt', 'a', encoding='utf-8') as out, ThreadPoolExecutor(max_workers=1) as writer:
+        pending_writes = []
+        for i in range(batch_size):
             link, article = all_articles[i]
+            word_count = word_counts[i]
             
             print(f"\n--- Processing article {i+1}/{batch_size} ---")
             elapsed = time.time() - start_time
@@ -350,93 +1020,105 @@ def main():
             est_remaining = avg_time * (batch_size - i - 1)
             
             print(f"Link: {link}")
-            print(f"Article length: {len(article.split())} words")
+            print(f"Article length: {word_count} words")
             print(f"Elapsed: {elapsed/60:.1f}min, Avg: {avg_time:.1f}s/article")
             print(f"Est. remaining: {est_remaining/60:.1f}min")
 
             # Skip articles that are too short for quality extemp questions
             # Note: This check is now redundant since we pre-filtered, but keeping for safety
-            if len(article.split()) < 150:
+            if word_count < 150:
                 print("Article too short for quality extemp questions, skipping...")
                 # Still count as processed so it gets removed from the file
                 processed_articles.append((link, article))
                 continue
 
-            # Extract headline from URL
-            article_info = extract_headline_from_url(link)
-            
-            # Generate Extemp questions
-            questions = generate_extemp_questions(article)
-            
-            # Write to output file
-            out.write(f"\n{link}\n")
-            out.write(f"Info: {article_info}\n")
-            out.write("="*80 + "\n")
-            out.write("NSDA EXTEMPORANEOUS SPEAKING QUESTIONS\n")
-            out.write("="*80 + "\n")
+            # Generate Extemp questions (next result from the batch)
+            backend_error = None
+            try:
+                questions = next(results)
+            except OSError as e:
+                # The generation server failed; this article and the rest stay in the input file
+                print(f"❌ Generation backend failed: {e}")
+                backend_error = e
             
-            if questions.strip():
-                out.write(questions + '\n\n')
-                successful_count += 1
-                print("✅ Extemp questions generated successfully")
-            else:
-                out.write("No valid extemp questions could be generated for this article.\n\n")
-                print("❌ Failed to generate valid extemp questions")
+            if backend_error is None:
+                if questions.strip():
+                    body = questions + '\n\n'
+                    successful_count += 1
+                    print("✅ Extemp questions generated successfully")
+                else:
+                    body = "No valid extemp questions could be generated for this article.\n\n"
+                    print("❌ Failed to generate valid extemp questions")
                 
-            out.write("="*80 + "\n\n")
-            out.flush()  # Ensure content is written immediately
-            
-            # Mark this article as processed (regardless of success/failure)
-            processed_articles.append((link, article))
+                # Write to output file as one record; it is flushed to disk at the next input file update
+                pending_writes.append(writer.submit(write_extemp_record, out, link, body))
+                
+                # Mark this article as processed (regardless of success/failure)
+                processed_articles.append((link, article))
             
             # Update the input file to remove processed articles after every few articles
-            if (i + 1) % 10 == 0 or i == batch_size - 1:  # Update every 10 articles or at the end
-                remaining_articles = all_articles[len(processed_articles):]
+            if backend_error is not None or (i + 1) % 10 == 0 or i == batch_size - 1:  # Update every 10 articles or at the end
+                if backend_error is not None:
+                    # Only the articles before this one are done with
+                    cut = end_offsets[i - 1] if i > 0 else 0
+                else:
+                    # Everything before the end of this article's block is done with
+                    cut = window_end if i == batch_size - 1 else end_offsets[i]
                 print(f"\n📝 Updating input file (removing {len(processed_articles)} processed articles)...")
+                # Questions must reach the disk before their articles leave the input file
+                for pending_write in pending_writes:
+                    pending_write.result()
+                pending_writes = []
+                out.flush()
+                os.fsync(out.fileno())
                 
-                # Try to write the updated file
-                max_retries = 3
+                # The trim is swapped in atomically, so a failed attempt leaves the file as it was
                 update_success = False
-                
-                for attempt in range(max_retries):
-                    if write_articles_to_file(input_file, remaining_articles):
-                        # Verify the write
-                        verification_articles = read_articles(input_file)
-                        if len(verification_articles) == len(remaining_articles):
-                            print(f"✅ Successfully updated input file: {len(remaining_articles)} articles remaining")
-                            update_success = True
-                            break
-                        else:
-                            print(f"⚠️ Write verification failed: expected {len(remaining_articles)}, found {len(verification_articles)}")
-                    
-                    if attempt < max_retries - 1:
-                        print(f"⚠️ Update attempt {attempt + 1} failed, retrying in 1 second...")
-                        time.sleep(1)
+                result = trim_articles_file(input_file, cut - trimmed)
+                if result is not None:
+                    removed, written_crc = result
+                    trimmed = cut
+                    removed_total += removed
+                    remaining_count = initial_count - removed_total
+                    # The trim size-checks its own copy; only rescan the file when VERIFY_WRITES is set
+                    found_count = count_articles(input_file) if verify_writes else remaining_count
+                    if found_count == remaining_count:
+                        print(f"✅ Successfully updated input file: {remaining_count} articles remaining")
+                        update_success = True
+                    else:
+                        print(f"⚠️ Write verification failed: expected {remaining_count}, found {found_count}")
                 
                 if not update_success:
-                    print("❌ Failed to update input file after all attempts")
+                    print("❌ Failed to update input file")
                     if backup_filename:
                         restore_from_backup(input_file, backup_filename)
                     return
+                
+                if backend_error is not None:
+                    print("❌ Stopping; the unprocessed articles stay in the input file for the next run")
+                    return
     
     total_time = time.time() - start_time
     print(f"\n✅ Batch complete: {successful_count}/{len(processed_articles)} articles processed successfully in {total_time/60:.1f} minutes")
     
     # Final verification
     print(f"\n🔍 Final verification...")
-    final_articles = read_articles(input_file)
-    expected_remaining = len(all_articles) - len(processed_articles)
-    actual_remaining = len(final_articles)
+    expected_remaining = initial_count - window_count
+    actual_remaining = count_articles(input_file)
+    # Compare the file against the bytes last written to it, once, instead of rescanning after every update
+    crc_ok = written_crc is None or file_crc32(input_file) == written_crc
+    if not crc_ok:
+        print("⚠️ Input file contents changed after the last update (CRC32 mismatch)")
     
     print(f"✅ Final status:")
-    print(f"   - Original articles (after filtering): {len(all_articles)}")
+    print(f"   - Original articles: {initial_count}")
     print(f"   - Processed articles: {len(processed_articles)}")
     print(f"   - Expected remaining: {expected_remaining}")
     print(f"   - Actual remaining: {actual_remaining}")
     print(f"   - Match: {'✅ YES' if expected_remaining == actual_remaining else '❌ NO'}")
     
     # Clean up backup if everything went well
-    if backup_filename and expected_remaining == actual_remaining:
+    if backup_filename and expected_remaining == actual_remaining and crc_ok:
         try:
             os.remove(backup_filename)
             print(f"🗑️ Cleaned up backup file")